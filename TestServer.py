@@ -13,7 +13,9 @@ import signal
 import sys
 import msvcrt
 import websockets
-from queue import Queue
+from websockets import broadcast
+
+from event_loop import run_event_loop
 
 PORT = 3000
 DELAY_BETWEEN_MESSAGES = 4  # seconds
@@ -27,9 +29,15 @@ payloads = [
     {"Language": "German", "Voice": {"Name": "Male"}, "Gender": "Male", "Payload": "Das ist deutsch männlich test.", "Speaker": "Test"},
 ]
 
+# serialized once, each SPACE press only sends the prebuilt frames
+# (str, so they go out as text frames like TextToTalk sends them)
+PAYLOAD_FRAMES = [(json.dumps({"Type": "Say", **p}), p["Payload"]) for p in payloads]
+PAYLOAD_COUNT = len(PAYLOAD_FRAMES)
+
 clients = set()
-send_queue = Queue()
-stop_event = threading.Event()
+send_queue = None  # asyncio.Queue, created in main()
+stop = None        # asyncio.Event, set to shut down
+loop = None        # running event loop, for wakeups from other threads
 
 # ------------------------
 # WebSocket handler
@@ -38,8 +46,8 @@ async def handler(ws):
     clients.add(ws)
     print(f"[TestServer] Client connected: {ws.remote_address}")
     try:
-        while not stop_event.is_set():
-            await asyncio.sleep(0.1)
+        # returns when the client disconnects or the server shuts down
+        await ws.wait_closed()
     except asyncio.CancelledError:
         pass
     finally:
@@ -50,21 +58,13 @@ async def handler(ws):
 # Send payloads from queue
 # ------------------------
 async def send_loop():
-    while not stop_event.is_set():
-        try:
-            task = send_queue.get_nowait()
-        except:
-            await asyncio.sleep(0.1)
-            continue
-        # task is just a trigger to send all 6 payloads
-        for i, payload in enumerate(payloads, 1):
-            msg = json.dumps({"Type": "Say", **payload})
-            for ws in list(clients):
-                try:
-                    await ws.send(msg)
-                except Exception as e:
-                    print(f"[TestServer] Send error: {e}")
-            print(f"[TestServer] Sent {i}/6: {payload['Payload']}")
+    while True:
+        task = await send_queue.get()
+        # task is just a trigger to send all payloads
+        for i, (frame, text) in enumerate(PAYLOAD_FRAMES, 1):
+            # broadcast() skips clients that are already closing
+            broadcast(clients, frame)
+            print(f"[TestServer] Sent {i}/{PAYLOAD_COUNT}: {text}")
             await asyncio.sleep(DELAY_BETWEEN_MESSAGES)
 
 # ------------------------
@@ -72,31 +72,49 @@ async def send_loop():
 # ------------------------
 def keyboard_thread():
     print("[TestServer] Press SPACE to send test messages, Ctrl-C to quit")
-    while not stop_event.is_set():
-        if msvcrt.kbhit():
-            key = msvcrt.getch()
-            if key == b" ":
-                send_queue.put("send")  # trigger send
-            elif key == b"\x03":  # Ctrl-C
-                stop_event.set()
-                break
-        else:
-            # sleep to reduce CPU usage
-            import time
-            time.sleep(0.05)
+    while True:
+        # getch() blocks until a key is pressed
+        key = msvcrt.getch()
+        if key == b" ":
+            loop.call_soon_threadsafe(send_queue.put_nowait, "send")  # trigger send
+        elif key == b"\x03":  # Ctrl-C
+            loop.call_soon_threadsafe(stop.set)
+            break
+
+# ------------------------
+# Signal handling
+# ------------------------
+def install_signal_handlers():
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            # not supported by Windows event loops
+            signal.signal(sig, lambda s, f: loop.call_soon_threadsafe(stop.set))
 
 # ------------------------
 # Main server
 # ------------------------
 async def main():
+    global send_queue, stop, loop
+    send_queue = asyncio.Queue()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    install_signal_handlers()
     async with websockets.serve(handler, "localhost", PORT):
         print(f"[TestServer] Running WebSocket server on ws://localhost:{PORT}")
         threading.Thread(target=keyboard_thread, daemon=True).start()
-        await send_loop()
+        sender = asyncio.create_task(send_loop())
+        stopper = asyncio.create_task(stop.wait())
+        # returns on shutdown, or early if send_loop fails
+        done, pending = await asyncio.wait({sender, stopper}, return_when=asyncio.FIRST_COMPLETED)
+        # cancelling the sender also interrupts a running send sequence
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        if sender in done and sender.exception() is not None:
+            print(f"[TestServer] Send loop failed: {sender.exception()!r}")
     print("[TestServer] Shutting down...")
 
 if __name__ == "__main__":
-    signal.signal(signal.SIGINT, lambda s, f: stop_event.set())
-    signal.signal(signal.SIGTERM, lambda s, f: stop_event.set())
-    asyncio.run(main())
-
+    run_event_loop(main())
@@ -1,14 +1,17 @@
 # -*- coding: utf-8 -*-
 
 import asyncio
-import json
+import atexit
 import sys
 import signal
 import threading
 import queue
-from datetime import datetime
+import logging
+import logging.handlers
 from dataclasses import dataclass
+from typing import Optional, Union
 
+import msgspec
 import websockets
 import comtypes.client
 import pythoncom
@@ -16,6 +19,7 @@ import re
 from wordfreq import zipf_frequency
 
 from emoji_map import EMOJI_MAP
+from event_loop import run_event_loop
 
 DEFAULT_RATE = 300
 DEFAULT_VOLUME = 100
@@ -47,6 +51,23 @@ JP_MALE    = "Microsoft Ichiro"
 SVS_ASYNC = 1
 SVS_PURGE = 2
 
+# all console output goes through one listener thread, so the websocket
+# loop never blocks on console I/O and lines keep their logging order
+log_queue = queue.SimpleQueue()
+
+log_handler = logging.StreamHandler(sys.stdout)
+log_handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+
+log_listener = logging.handlers.QueueListener(log_queue, log_handler)
+log_listener.start()
+# flush pending log records on every exit path
+atexit.register(log_listener.stop)
+
+log = logging.getLogger("wintotalk")
+log.setLevel(logging.INFO)
+log.propagate = False
+log.addHandler(logging.handlers.QueueHandler(log_queue))
+
 def detect_chat_language(text, default_language):
 
     text = text.strip()
@@ -55,14 +76,14 @@ def detect_chat_language(text, default_language):
     # Japanese shortcut
     # -------------------------
     if re.search(r"[ぁ-んァ-ン一-龯]", text):
-        print("[WinToTalk] (shortcut) Detect Language = Japanese")
+        log.info("[WinToTalk] (shortcut) Detect Language = Japanese")
         return "Japanese"
 
     # -------------------------
     # German Umlaut Shortcut
     # -------------------------
     if any(c in text for c in "äöüÄÖÜß"):
-        print("[WinToTalk] (shortcut) Detect Language = German")
+        log.info("[WinToTalk] (shortcut) Detect Language = German")
         return "German"
 
     # -------------------------
@@ -71,7 +92,7 @@ def detect_chat_language(text, default_language):
     EMOTE_PATTERN = r"^(?:[:;=8xX][-^]?[)DPOo3]+|o/|\\o/|<3|xD|XD|:D|:\)|:\(|owo|uwu|O_o|o_O)$"
 
     if re.match(EMOTE_PATTERN, text):
-        print("[WinToTalk] (emote detected)")
+        log.info("[WinToTalk] (emote detected)")
         return default_language
 
     # -------------------------
@@ -91,7 +112,7 @@ def detect_chat_language(text, default_language):
     words = [w for w in words if len(w) > 1]
 
     if len(words) == 0:
-        print("[WinToTalk] (no valid words) using default language")
+        log.info("[WinToTalk] (no valid words) using default language")
         return default_language
 
     # -------------------------
@@ -126,14 +147,14 @@ def detect_chat_language(text, default_language):
     avg_score = best_score / word_count
     avg_diff = (best_score - second_score) / word_count
 
-    print("[WinToTalk] (wordfreq scores)")
-    print("   de =", round(de_score,2))
-    print("   en =", round(en_score,2))
-    print("   fr =", round(fr_score,2))
-    print("   es =", round(es_score,2))
+    log.info("[WinToTalk] (wordfreq scores)")
+    log.info("   de = %s", round(de_score,2))
+    log.info("   en = %s", round(en_score,2))
+    log.info("   fr = %s", round(fr_score,2))
+    log.info("   es = %s", round(es_score,2))
 
-    print("[WinToTalk] (wordfreq avg_score =", round(avg_score,2), ")")
-    print("[WinToTalk] (wordfreq avg_diff =", round(avg_diff,2), ")")
+    log.info("[WinToTalk] (wordfreq avg_score = %s )", round(avg_score,2))
+    log.info("[WinToTalk] (wordfreq avg_diff = %s )", round(avg_diff,2))
 
     # -------------------------
     # Confidence Check
@@ -143,7 +164,7 @@ def detect_chat_language(text, default_language):
     # High confidence
     # -------------------------
     if avg_score >= 2.5 and avg_diff >= 0.6:
-        print(f"[WinToTalk] (wordfreq confident) Detect Language = {best_language}")
+        log.info("[WinToTalk] (wordfreq confident) Detect Language = %s", best_language)
         return best_language
         
         
@@ -151,14 +172,14 @@ def detect_chat_language(text, default_language):
     # Medium confidence → TRUST wordfreq!
     # -------------------------
     if avg_score >= 2.0 and avg_diff >= 0.3:
-        print(f"[WinToTalk] (wordfreq medium) Detect Language = {best_language}")
+        log.info("[WinToTalk] (wordfreq medium) Detect Language = %s", best_language)
         return best_language
 
     # -------------------------
     # Default fallback
     # -------------------------
 
-    print("[WinToTalk] (default) Detect Language =", default_language)
+    log.info("[WinToTalk] (default) Detect Language = %s", default_language)
     return default_language
     
 
@@ -178,7 +199,7 @@ def replace_emojis_for_speech(text, language, default_language="English"):
                 if replacement is None:
                     continue  # nichts ersetzen
     
-                print("replacement: "+replacement)
+                log.info("replacement: %s", replacement)
                 text = text.replace(emo, replacement)
 
     return text    
@@ -193,6 +214,26 @@ class SpeechItem:
     speaker: str
 
 
+class MessageVoice(msgspec.Struct):
+    Name: Optional[str] = None
+
+
+class Message(msgspec.Struct):
+    """Say/Cancel message from TextToTalk, unknown fields are ignored.
+
+    Every field may be missing or null, fallbacks are applied
+    in process_message.
+    """
+    Type: Optional[str] = None
+    Payload: Optional[str] = None
+    Language: Optional[str] = None
+    Voice: Optional[MessageVoice] = None
+    Rate: Optional[Union[int, float]] = None
+    Speaker: Optional[str] = None
+
+
+message_decoder = msgspec.json.Decoder(Message)
+
 speech_queue = queue.Queue()
 
 cancel_event = threading.Event()
@@ -207,11 +248,22 @@ def sanitize_for_sapi(text: str) -> str:
 
     return text
 
-def rate_to_sapi(rate):
+def compute_sapi_rate(rate):
     baseline = 200
     diff = rate - baseline
     return max(-10, min(10, int(diff / 20)))
 
+# precomputed SAPI rates for the usual words-per-minute range
+SAPI_RATES = {wpm: compute_sapi_rate(wpm) for wpm in range(50, 601)}
+
+def rate_to_sapi(rate):
+    sapi_rate = SAPI_RATES.get(rate)
+
+    if sapi_rate is None:
+        sapi_rate = compute_sapi_rate(rate)
+
+    return sapi_rate
+
 
 # Mapping für Logging
 VOICE_MAP = {
@@ -232,113 +284,90 @@ VOICE_MAP = {
     "JP_MALE": JP_MALE,
 }
 
-def select_voice(voice, language, gender):
-    """Select one of the configured voices and log clearly."""
-
-    language = language.lower()
-    gender = gender.lower()
-
-    # ------------------------
-    # German
-    # ------------------------
-    if language.startswith("german"):
-
-        if gender == "male":
-            chosen = "DE_MALE"
-
-        elif gender == "female":
-            chosen = "DE_FEMALE"
-
-        else:
-            chosen = "DE_NEUTRAL"
+# (language, gender) -> VOICE_MAP key
+VOICE_KEY = {
+    ("german", "male"): "DE_MALE",
+    ("german", "female"): "DE_FEMALE",
+    ("german", "none"): "DE_NEUTRAL",
+    ("spanish", "male"): "ES_MALE",
+    ("spanish", "female"): "ES_FEMALE",
+    ("spanish", "none"): "ES_NEUTRAL",
+    ("french", "male"): "FR_MALE",
+    ("french", "female"): "FR_FEMALE",
+    ("french", "none"): "FR_NEUTRAL",
+    ("japanese", "male"): "JP_MALE",
+    ("japanese", "female"): "JP_FEMALE",
+    ("japanese", "none"): "JP_NEUTRAL",
+    ("english", "male"): "EN_MALE",
+    ("english", "female"): "EN_FEMALE",
+    ("english", "none"): "EN_NEUTRAL",
+}
 
-    # ------------------------
-    # Spanish
-    # ------------------------
-    elif language.startswith("spanish"):
+# language prefixes matched against the message language
+VOICE_LANGUAGES = ("german", "spanish", "french", "japanese", "english")
 
-        if gender == "male":
-            chosen = "ES_MALE"
+def build_voice_cache(voice):
+    """Resolve the configured voices to SAPI voice tokens once."""
 
-        elif gender == "female":
-            chosen = "ES_FEMALE"
+    voice_tokens = {}
 
-        else:
-            chosen = "ES_NEUTRAL"
+    for v in voice.GetVoices():
+        description = v.GetDescription().lower()
 
-    # ------------------------
-    # French
-    # ------------------------
-    elif language.startswith("french"):
+        for key, voice_name in VOICE_MAP.items():
+            if key not in voice_tokens and voice_name.lower() in description:
+                voice_tokens[key] = v
 
-        if gender == "male":
-            chosen = "FR_MALE"
+    return voice_tokens
 
-        elif gender == "female":
-            chosen = "FR_FEMALE"
 
-        else:
-            chosen = "FR_NEUTRAL"
+def select_voice(voice, voice_tokens, language, gender):
+    """Select one of the configured voices and log clearly."""
 
-    # ------------------------
-    # Japanese
-    # ------------------------
-    elif language.startswith("japanese"):
+    language = language.lower()
+    gender = gender.lower()
 
-        if gender == "male":
-            chosen = "JP_MALE"
+    # Default: English
+    lang_key = "english"
 
-        elif gender == "female":
-            chosen = "JP_FEMALE"
+    for prefix in VOICE_LANGUAGES:
+        if language.startswith(prefix):
+            lang_key = prefix
+            break
 
-        else:
-            chosen = "JP_NEUTRAL"
-            
-    # ------------------------
-    # English
-    # ------------------------
-    elif language.startswith("english"):
+    if gender not in ("male", "female"):
+        gender = "none"
 
-        if gender == "male":
-            chosen = "EN_MALE"
+    chosen = VOICE_KEY[(lang_key, gender)]
 
-        elif gender == "female":
-            chosen = "EN_FEMALE"
+    voice_name = VOICE_MAP[chosen]
 
-        else:
-            chosen = "EN_NEUTRAL"
+    token = voice_tokens.get(chosen)
 
-    # ------------------------
-    # Default: English
-    # ------------------------
-    else:
+    if token is not None:
+        voice.Voice = token
+        log.info("[WinToTalk] Selected voice constant: %s -> %s", chosen, voice_name)
+        return chosen, voice_name
 
-        if gender == "male":
-            chosen = "EN_MALE"
+    log.warning("[WinToTalk] Warning: voice '%s' not found, using default", voice_name)
+    return chosen, "Default system voice"
 
-        elif gender == "female":
-            chosen = "EN_FEMALE"
 
-        else:
-            chosen = "EN_NEUTRAL"
+def create_voice():
+    """Create SAPI.SpVoice on the typed ISpeechVoice interface (vtable calls, no IDispatch)."""
 
-    voice_name = VOICE_MAP[chosen]
+    comtypes.client.GetModule("sapi.dll")
+    from comtypes.gen import SpeechLib
 
-    for v in voice.GetVoices():
-        if voice_name.lower() in v.GetDescription().lower():
-            voice.Voice = v
-            print(f"[WinToTalk] Selected voice constant: {chosen} -> {voice_name}")
-            return chosen, voice_name
-
-    print(f"[WinToTalk] Warning: voice '{voice_name}' not found, using default")
-    return chosen, "Default system voice"
+    return comtypes.client.CreateObject("SAPI.SpVoice", interface=SpeechLib.ISpeechVoice)
 
 
 def tts_worker():
 
     pythoncom.CoInitialize()
 
-    voice = comtypes.client.CreateObject("SAPI.SpVoice")
+    voice = create_voice()
+    voice_tokens = build_voice_cache(voice)
 
     #print("[TTS] Worker started")
 
@@ -355,26 +384,38 @@ def tts_worker():
 
             #print(f"[TTS] QUEUE GET ({item.speaker}) | size={speech_queue.qsize()}")
 
-            voice.Volume = item.volume
-            voice.Rate = rate_to_sapi(item.rate)
-
-            language = detect_chat_language(item.text, item.language)
-            select_voice(voice, language, item.gender)
-
             #print(f"[TTS] SPEAK START ({item.speaker})")
 
             cancel_event.clear()
 
+            # errors must not end the worker, it is the only speaker
             try:
+                sapi_rate = rate_to_sapi(item.rate)
+
+                language = detect_chat_language(item.text, item.language)
+
                 # Emojis nach Detection in text ersetzen
                 emoji_text = replace_emojis_for_speech(item.text, language, item.language)
                 
                 safe_text = sanitize_for_sapi(emoji_text)
+            except Exception as e:
+                log.error("[TTS] Skipping message, text preparation failed: %s", e)
+                speech_queue.task_done()
+                continue
+
+            # only COM errors recreate the voice
+            try:
+                voice.Volume = item.volume
+                voice.Rate = sapi_rate
+
+                select_voice(voice, voice_tokens, language, item.gender)
 
                 voice.Speak(safe_text, SVS_ASYNC)
             except Exception as e:
-                print("[TTS] Recovering from SAPI error:", e)
-                voice = comtypes.client.CreateObject("SAPI.SpVoice")
+                log.error("[TTS] Recovering from SAPI error: %s", e)
+                voice = create_voice()
+                voice_tokens = build_voice_cache(voice)
+                speech_queue.task_done()
                 continue
 
             while True:
@@ -415,7 +456,7 @@ def enqueue_speech(text, language, gender, rate, volume, speaker):
     #print(f"[TTS] QUEUE PUT ({speaker}) | size={speech_queue.qsize()}")
     
     if speech_queue.qsize() > 100:
-        print("[TTS] queue overflow, clearing")
+        log.warning("[TTS] queue overflow, clearing")
         with speech_queue.mutex:
             speech_queue.queue.clear()
 
@@ -431,43 +472,38 @@ async def process_message(msg):
 
     try:
 
-        data = json.loads(msg)
+        data = message_decoder.decode(msg)
 
-        msg_type = data.get("Type", "").lower()
+        # Type is matched case-insensitively, so no msgspec tagged union here
+        msg_type = (data.Type or "").lower()
 
         if msg_type == "say":
 
-            payload = data.get("Payload", "")
-            language = data.get("Language", "English")
+            payload = data.Payload if data.Payload is not None else ""
+            language = data.Language if data.Language is not None else "English"
 
-            gender = data.get("Voice", {}).get("Name", "None")
+            if data.Voice is not None and data.Voice.Name is not None:
+                gender = data.Voice.Name
+            else:
+                gender = "None"
 
-            rate = data.get("Rate", DEFAULT_RATE)
-            speaker = data.get("Speaker", "Unknown")
+            rate = data.Rate if data.Rate is not None else DEFAULT_RATE
+            speaker = data.Speaker if data.Speaker is not None else "Unknown"
 
-            print("")
-            print(datetime.now(), "Say")
-            print("Language:", language)
-            print("Gender:", gender)
-            print("Speaker:", speaker)
-            print("Rate:", rate)
-            print("Text:", payload)
-            print("")
-            
+            log.info("Say language=%s gender=%s speaker=%s rate=%s text=%s",
+                     language, gender, speaker, rate, payload)
 
             enqueue_speech(payload, language, gender, rate, DEFAULT_VOLUME, speaker)
 
         elif msg_type == "cancel":
-            
-            print("")
-            print(datetime.now(), "Cancel")
-            print("")
+
+            log.info("Cancel")
 
             cancel_current()
 
     except Exception as e:
 
-        print("Message error:", e)
+        log.error("Message error: %s", e)
 
 
 async def websocket_loop(uri):
@@ -478,7 +514,7 @@ async def websocket_loop(uri):
 
             async with websockets.connect(uri) as ws:
 
-                print("[WinToTalk] Connected")
+                log.info("[WinToTalk] Connected")
 
                 while True:
 
@@ -488,14 +524,14 @@ async def websocket_loop(uri):
 
         except Exception as e:
 
-            print("WebSocket error:", e)
+            log.error("WebSocket error: %s", e)
 
             await asyncio.sleep(1)
 
 
 def shutdown(*args):
 
-    print("[WinToTalk] Shutdown")
+    log.info("[WinToTalk] Shutdown")
 
     stop_event.set()
     cancel_event.set()
@@ -514,4 +550,4 @@ if __name__ == "__main__":
     signal.signal(signal.SIGINT, shutdown)
     signal.signal(signal.SIGTERM, shutdown)
 
-    asyncio.run(websocket_loop(URI))
+    run_event_loop(websocket_loop(URI))
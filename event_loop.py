@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+
+# -------------------------
+# Event loop runner
+# -------------------------
+import asyncio
+
+try:
+    # faster event loop if installed (Windows port of uvloop)
+    import winloop
+except ImportError:
+    winloop = None
+
+
+def run_event_loop(main):
+    """Run the main coroutine on winloop if installed, else on plain asyncio."""
+
+    if winloop is None:
+        return asyncio.run(main)
+
+    return winloop.run(main)